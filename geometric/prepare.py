@@ -39,19 +39,33 @@ import json
 import os
 import itertools
 import numpy as np
+import re
 import shutil
 
 import os
 
-from .ase_engine import EngineASE
+from functools import lru_cache
+from operator import attrgetter
+
 from .errors import EngineError, InputError
 from .internal import Distance, Angle, Dihedral, CartesianX, CartesianY, CartesianZ, TranslationX, TranslationY, TranslationZ, RotationA, RotationB, RotationC, CentroidDistance
-from .engine import set_tcenv, load_tcin, TeraChem, ConicalIntersection, Psi4, QChem, Gromacs, Molpro, OpenMM, QCEngineAPI, Gaussian, QUICK, CFOUR
 from .molecule import Molecule, Elements
 from .nifty import logger, isint, uncommadash, bohr2ang, ang2bohr
-from .rotate import calc_fac_dfac
+from .rotate import calc_fac_dfac, calc_fac_dfac_vec
 from .xml_helper import read_coors_from_xml, write_coors_to_xml
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+@lru_cache(maxsize=None)
+def _which(name):
+    # shutil.which walks $PATH and stats candidate files on every call;
+    # drivers such as NEB/MECI may call get_molecule_engine once per
+    # state or image, so cache the executable lookups.
+    return shutil.which(name)
+
 def get_molecule_engine(**kwargs):
     """
     Parameters
@@ -115,6 +129,7 @@ def get_molecule_engine(**kwargs):
                 sub_kwargs['meci'] = None
                 M, sub_engine = get_molecule_engine(**sub_kwargs)
                 sub_engines.append(sub_engine)
+            from .engine import ConicalIntersection
             engine = ConicalIntersection(M, sub_engines, meci_sigma, meci_alpha)
         return M, engine
 
@@ -128,6 +143,14 @@ def get_molecule_engine(**kwargs):
     for i in range(nrad):
         radii[arg_radii[2*i].capitalize()] = float(arg_radii[2*i+1])
 
+    # If coordinates are replaced below (via --coords or a NEB chain), the
+    # topology is rebuilt after the replacement; skip the initial topology
+    # build in that case, since it would be thrown away.  build_topology is
+    # one of the more expensive setup steps for large systems.
+    NEB = kwargs.get('neb', False)
+    reload_coords = NEB or kwargs.get('coords', None) is not None
+    build_topo = not reload_coords
+
     using_qchem = False
     threads_enabled = False
     if engine_str:
@@ -141,6 +164,9 @@ def get_molecule_engine(**kwargs):
             raise RuntimeError("engine and customengine cannot simultaneously be set")
         if engine_str == 'tera':
             logger.info("TeraChem engine selected. Expecting TeraChem input for gradient calculation.\n")
+            # Engine classes are imported locally in each branch so that a
+            # single invocation only pays the import cost of the engine it uses.
+            from .engine import set_tcenv, load_tcin, TeraChem
             set_tcenv()
             tcin = load_tcin(inputf)
             # The QM-MM interface is designed on the following ideas:
@@ -167,14 +193,18 @@ def get_molecule_engine(**kwargs):
                 prmtop_name = tcin['prmtop']
                 prmtop = AmberPrmtopFile(prmtop_name)
                 M_full = Molecule(tcin['coordinates'], ftype='inpcrd', build_topology=False)
-                M_full.elem = [a.element.symbol for a in list(prmtop.topology.atoms())]
-                M_full.resid = [a.residue.index for a in list(prmtop.topology.atoms())]
+                # Traverse the topology once; attrgetter keeps the attribute
+                # chain lookups in C for large systems.
+                prmtop_atoms = list(prmtop.topology.atoms())
+                M_full.elem = list(map(attrgetter('element.symbol'), prmtop_atoms))
+                M_full.resid = list(map(attrgetter('residue.index'), prmtop_atoms))
                 qmindices_name = tcin['qmindices']
-                qmindices = [int(i.split()[0]) for i in open(qmindices_name).readlines()]
-                M = M_full.atom_select(qmindices)
+                qmindices = np.loadtxt(qmindices_name, usecols=0, dtype=int, ndmin=1).tolist()
+                M = M_full.atom_select(qmindices, build_topology=False)
                 M.top_settings['radii'] = radii
                 M.top_settings['fragment'] = frag
-                M.build_topology()
+                if build_topo:
+                    M.build_topology()
             elif qmmm_openmm:
                 if qmmm_amber:
                     raise RuntimeError("prmtop and system_xml cannot both be in TC input file")
@@ -187,67 +217,72 @@ def get_molecule_engine(**kwargs):
                 if not os.path.exists(tcin['qmindices']):
                     raise RuntimeError("TeraChem QM/MM qmindices file does not exist")
 
-                M_full = Molecule(pdb) 
-                read_coors_from_xml(M_full, tcin['coordinates']) 
+                M_full = Molecule(pdb, build_topology=False)
+                read_coors_from_xml(M_full, tcin['coordinates'])
 
                 qmindices_name = tcin['qmindices']
-                grdindices = [int(i.split()[0]) for i in open(qmindices_name).readlines()]
+                grdindices = np.loadtxt(qmindices_name, usecols=0, dtype=int, ndmin=1).tolist()
                 if 'printmmgrad' in tcin:
-                    mmgrdindices = [int(i.split()[0]) for i in open(tcin['printmmgrad']).readlines()]
+                    mmgrdindices = np.loadtxt(tcin['printmmgrad'], usecols=0, dtype=int, ndmin=1).tolist()
                     grdindices += mmgrdindices
                     # remove redundant and sort indices 
                     grdindices = list(set(grdindices))
                     grdindices.sort()
-                M = M_full.atom_select(grdindices)
+                M = M_full.atom_select(grdindices, build_topology=False)
                 M.top_settings['radii'] = radii
                 M.top_settings['fragment'] = frag
-                M.build_topology()
+                if build_topo:
+                    M.build_topology()
             elif pdb is not None:
-                M = Molecule(pdb, radii=radii, fragment=frag)
+                M = Molecule(pdb, radii=radii, fragment=frag, build_topology=build_topo)
             else:
                 if not os.path.exists(tcin['coordinates']):
                     raise RuntimeError("TeraChem coordinate file does not exist")
-                M = Molecule(tcin['coordinates'], radii=radii, fragment=frag)
+                M = Molecule(tcin['coordinates'], radii=radii, fragment=frag, build_topology=build_topo)
             M.charge = tcin['charge']
             M.mult = tcin.get('spinmult',1)
             engine = TeraChem(M, tcin, dirname=dirname, pdb=pdb)
         elif engine_str == 'qchem':
             logger.info("Q-Chem engine selected. Expecting Q-Chem input for gradient calculation.\n")
+            from .engine import QChem
             # The file from which we make the Molecule object
             if pdb is not None:
                 # If we pass the PDB, then read both the PDB and the Q-Chem input file,
                 # then copy the Q-Chem rem variables over to the PDB
-                M = Molecule(pdb, radii=radii, fragment=frag)
-                M1 = Molecule(inputf, radii=radii)
+                M = Molecule(pdb, radii=radii, fragment=frag, build_topology=build_topo)
+                M1 = Molecule(inputf, radii=radii, build_topology=False)
                 for i in ['qctemplate', 'qcrems', 'elem', 'qm_ghost', 'charge', 'mult']:
                     M.Data[i] = M1.Data[i]
             else:
-                M = Molecule(inputf, radii=radii)
+                M = Molecule(inputf, radii=radii, build_topology=build_topo)
             engine = QChem(M, dirname=dirname, qcdir=qcdir, threads=threads)
             using_qchem = True
             threads_enabled = True
         elif engine_str == 'gmx':
             logger.info("Gromacs engine selected. Expecting conf.gro, topol.top and shot.mdp (exact names).\n")
-            M = Molecule(inputf, radii=radii, fragment=frag)
+            from .engine import Gromacs
+            M = Molecule(inputf, radii=radii, fragment=frag, build_topology=build_topo)
             if pdb is not None:
-                M = Molecule(pdb, radii=radii, fragment=frag)
+                M = Molecule(pdb, radii=radii, fragment=frag, build_topology=build_topo)
             if 'boxes' in M.Data:
                 del M.Data['boxes']
             engine = Gromacs(M)
         elif engine_str == 'openmm':
             logger.info("OpenMM engine selected. Expecting forcefield.xml or system.xml file, and PDB passed in via --pdb.\n")
+            from .engine import OpenMM
             if pdb is None:
                 raise RuntimeError("Must pass a PDB with option --pdb to use OpenMM.")
-            M = Molecule(pdb, radii=radii, fragment=frag)
+            M = Molecule(pdb, radii=radii, fragment=frag, build_topology=build_topo)
             if 'boxes' in M.Data:
                 del M.Data['boxes']
             engine = OpenMM(M, pdb, inputf)
         elif engine_str == 'psi4':
             logger.info("Psi4 engine selected. Expecting Psi4 input for gradient calculation.\n")
+            from .engine import Psi4
             engine = Psi4(threads=threads)
             engine.load_psi4_input(inputf)
             if pdb is not None:
-                M = Molecule(pdb, radii=radii, fragment=frag)
+                M = Molecule(pdb, radii=radii, fragment=frag, build_topology=False)
                 # Make the PDB Molecule the engine's Molecule
                 # but keep the original 'elem'.
                 M1 = engine.M
@@ -256,14 +291,16 @@ def get_molecule_engine(**kwargs):
             else:
                 M = engine.M
                 M.top_settings['radii'] = radii
-            M.build_topology()
+            if build_topo:
+                M.build_topology()
             threads_enabled = True
         elif engine_str == 'molpro':
             logger.info("Molpro engine selected. Expecting Molpro input for gradient calculation.\n")
+            from .engine import Molpro
             engine = Molpro(threads=threads)
             engine.load_molpro_input(inputf)
             if pdb is not None:
-                M = Molecule(pdb, radii=radii, fragment=frag)
+                M = Molecule(pdb, radii=radii, fragment=frag, build_topology=False)
                 # Make the PDB Molecule the engine's Molecule
                 # but keep the original 'elem'.
                 M1 = engine.M
@@ -272,24 +309,26 @@ def get_molecule_engine(**kwargs):
             else:
                 M = engine.M
                 M.top_settings['radii'] = radii
-            M.build_topology()
+            if build_topo:
+                M.build_topology()
             if molproexe is not None:
                 engine.set_molproexe(molproexe)
             threads_enabled = True
         elif engine_str == "gaussian":
             logger.info("Gaussian engine selected. Expecting Gaussian input for gradient calculation. \n")
+            from .engine import Gaussian
             if pdb is not None:
                 # Use the PDB Molecule, but the Gaussian input's elem, charge, mult
-                M = Molecule(pdb, radii=radii, fragment=frag)
-                M1 = Molecule(inputf, radii=radii)
+                M = Molecule(pdb, radii=radii, fragment=frag, build_topology=build_topo)
+                M1 = Molecule(inputf, radii=radii, build_topology=False)
                 for i in ['elem', 'charge', 'mult']:
                     M.Data[i] = M1.Data[i]
             else:
-                M = Molecule(inputf, radii=radii)
+                M = Molecule(inputf, radii=radii, build_topology=build_topo)
             # now work out which gaussian version we have
-            if shutil.which("g16") is not None:
+            if _which("g16") is not None:
                 exe = "g16"
-            elif shutil.which("g09") is not None:
+            elif _which("g09") is not None:
                 exe = "g09"
             else:
                 raise ValueError("Neither g16 or g09 was found, please check the environment.")
@@ -300,9 +339,10 @@ def get_molecule_engine(**kwargs):
             engine.load_gaussian_input(inputf)
         elif engine_str == 'cfour':
             logger.info("CFOUR engine selected. Expecting CFOUR input for gradient calculation.\n")
+            from .engine import CFOUR
             engine = CFOUR(inputf)
             if pdb is not None:
-                M = Molecule(pdb, radii=radii, fragment=frag)
+                M = Molecule(pdb, radii=radii, fragment=frag, build_topology=False)
                 # Make the PDB Molecule the engine's Molecule
                 # but keep the original 'elem'.
                 M1 = engine.M
@@ -311,19 +351,21 @@ def get_molecule_engine(**kwargs):
             else:
                 M = engine.M
                 M.top_settings['radii'] = radii
-            M.build_topology()
+            if build_topo:
+                M.build_topology()
             threads_enabled = False
         elif engine_str == "quick":
             logger.info("QUICK engine selected. Expecting QUICK input for gradient calculation. \n")
-            M = Molecule(inputf, radii=radii, fragment=frag)
+            from .engine import QUICK
+            M = Molecule(inputf, radii=radii, fragment=frag, build_topology=build_topo)
             # now work out which quick version we have
-            if shutil.which("quick.cuda.MPI") is not None:
+            if _which("quick.cuda.MPI") is not None:
                 exe = "quick.cuda.MPI"
-            elif shutil.which("quick.cuda") is not None:
+            elif _which("quick.cuda") is not None:
                 exe = "quick.cuda"
-            elif shutil.which("quick.MPI") is not None:
+            elif _which("quick.MPI") is not None:
                 exe = "quick.MPI"
-            elif shutil.which("quick") is not None:
+            elif _which("quick") is not None:
                 exe = "quick"
             else:
                 raise ValueError("Neither quick.cuda.MPI, quick.cuda, quick.MPI or quick was found, please check the environment.")
@@ -334,6 +376,7 @@ def get_molecule_engine(**kwargs):
             engine.load_quick_input(inputf)
         elif engine_str == 'qcengine':
             logger.info("QCEngine selected.\n")
+            from .engine import QCEngineAPI
             schema = kwargs.get('qcschema', None)
             if schema is None:
                 raise RuntimeError("QCEngineAPI option requires a QCSchema")
@@ -345,7 +388,8 @@ def get_molecule_engine(**kwargs):
             M = engine.M
         elif engine_str == "ase":
             logger.info("ASE-Calculator engine selected. \n")
-            M = Molecule(kwargs.get("input"), radii=radii, fragment=frag)
+            from .ase_engine import EngineASE
+            M = Molecule(kwargs.get("input"), radii=radii, fragment=frag, build_topology=build_topo)
 
             ase_class_name = kwargs.get("ase_class")
             ase_kwargs = kwargs.get("ase_kwargs", "{}")
@@ -369,8 +413,6 @@ def get_molecule_engine(**kwargs):
 
     # When --coords is provided, it will overwrite the previous coordinate.
 
-    NEB = kwargs.get('neb', False)
-
     # 2022-09-13: If extra coordinates are provided, the topology may be rebuilt. This decision can be revisited later.
     if not NEB and kwargs.get('coords', None) is not None:
         M.load_frames(kwargs.get('coords'))
@@ -388,8 +430,9 @@ def get_molecule_engine(**kwargs):
             images = len(M)
         M1 = M
         logger.info("Input coordinates have %i frames. The following will be used to initialize NEB images: \n" % len(M1))
-        logger.info(', '.join(["%i" % (int(round(i))) for i in np.linspace(0, len(M1) - 1, images)]) + "\n")
-        M = M1[np.array([int(round(i)) for i in np.linspace(0, len(M1) - 1, images)])]
+        idx = np.linspace(0, len(M1) - 1, images).round().astype(np.intp)
+        logger.info(', '.join(idx.astype(str)) + "\n")
+        M = M1[idx]
         M.build_topology()
 
     # Perform some sanity checks on arguments
@@ -419,13 +462,270 @@ def one_dimensional_scan(init, final, steps):
     list
         List of lists that interpolate between init and final, including endpoints.
     """
-    if len(init) != len(final):
+    init = np.asarray(init, dtype=float)
+    final = np.asarray(final, dtype=float)
+    if init.shape != final.shape:
         raise RuntimeError("init and final must have the same length")
-    Answer = []
-    for j in range(len(init)):
-        Answer.append(np.linspace(init[j], final[j], steps))
-    Answer = list([list(i) for i in np.array(Answer).T])
-    return Answer
+    # For large grids the JIT-compiled kernel writes straight into a
+    # preallocated buffer; below the threshold (or without Numba) the
+    # broadcasted np.linspace is faster than paying the dispatch overhead.
+    if njit is not None and steps > 1 and steps * init.size > _LINSCAN_NUMBA_THRESHOLD:
+        out = np.empty((steps, init.shape[0]))
+        _linscan_kernel(init, final, steps, out)
+        return out.tolist()
+    # np.linspace broadcasts over the endpoint vectors in a single pass,
+    # producing a (steps, N) array that is converted to the expected list-of-lists.
+    return np.linspace(init, final, steps, axis=0).tolist()
+
+
+# Only hand one_dimensional_scan to the Numba kernel when the grid has enough
+# points to amortize the dispatch overhead.
+_LINSCAN_NUMBA_THRESHOLD = 10000
+
+def _linscan_kernel(init, final, steps, out):
+    N = init.shape[0]
+    inv = 1.0/(steps-1)
+    for j in range(steps):
+        t = j*inv
+        for k in range(N):
+            out[j, k] = init[k] + t*(final[k]-init[k])
+
+if njit is not None:
+    _linscan_kernel = njit(cache=True, fastmath=True)(_linscan_kernel)
+
+
+def _rotset_vals(theta, u, rg):
+    """
+    Compute the constraint values for a "rotation" constraint: map the rotation
+    by angle(s) theta about the unit axis u onto the exponential map, scaled by
+    the radius of gyration rg.  Returns a (3,) array for a scalar theta and a
+    (len(theta), 3) array when theta is an array of scan angles.
+    """
+    # Get the periodic image(s) that are inside of the pi-sphere.
+    theta3 = (np.asarray(theta) + np.pi) % (2*np.pi) - np.pi
+    c = np.cos(theta3*0.5)
+    s = np.sin(theta3*0.5)
+    if theta3.ndim == 0:
+        fac, _ = calc_fac_dfac(float(c))
+    else:
+        fac, _ = calc_fac_dfac_vec(c)
+    return np.multiply.outer(fac*s*rg, u)
+
+
+# The key in this dictionary is for looking up the following information:
+# 1) The classes for creating the primitive coordinates corresponding to the constraint
+# 2) The number of atomic indices that are required to specify the constraint
+_CLASS_DICT = {"distance":([Distance], 2),
+               "angle":([Angle], 3),
+               "dihedral":([Dihedral], 4),
+               "x":([CartesianX], 1),
+               "y":([CartesianY], 1),
+               "z":([CartesianZ], 1),
+               "xy":([CartesianX, CartesianY], 1),
+               "xz":([CartesianX, CartesianZ], 1),
+               "yz":([CartesianY, CartesianZ], 1),
+               "xyz":([CartesianX, CartesianY, CartesianZ], 1),
+               "trans-x":([TranslationX], 1),
+               "trans-y":([TranslationY], 1),
+               "trans-z":([TranslationZ], 1),
+               "trans-xy":([TranslationX, TranslationY], 1),
+               "trans-xz":([TranslationX, TranslationZ], 1),
+               "trans-yz":([TranslationY, TranslationZ], 1),
+               "trans-xyz":([TranslationX, TranslationY, TranslationZ], 1),
+               "rotation":([RotationA, RotationB, RotationC], 1),
+               "centroid_distance":([CentroidDistance], 2)
+               }
+# Pre-resolved views of _CLASS_DICT, so the per-line lookups do not unpack a tuple.
+_CLASSES_FOR_KEY = dict([(k, v[0]) for k, v in _CLASS_DICT.items()])
+_NATOM_FOR_KEY = dict([(k, v[1]) for k, v in _CLASS_DICT.items()])
+_ATOM_KEYS = frozenset(["x", "y", "z", "xy", "yz", "xz", "xyz"])
+_TRANS_KEYS = frozenset(["trans-x", "trans-y", "trans-z", "trans-xy", "trans-yz", "trans-xz", "trans-xyz"])
+# Matches an entire $options ... $end block in a constraints file, including
+# the delimiter lines; an unterminated block runs to the end of the string.
+_OPTIONS_BLOCK_RE = re.compile(r'[^\n]*\$options.*?(?:\$end[^\n]*|\Z)', re.DOTALL)
+
+#===========================================================#
+#| Handlers for the constraint lines in parse_constraints. |#
+#| One handler per (key group, mode); each returns a list  |#
+#| of constraint groups and a matching list of value       |#
+#| groups to be appended for the current line.             |#
+#===========================================================#
+
+def _handle_atom_freeze(molecule, coords, s, key, classes, n_atom, atoms):
+    # One group of frozen constraints is appended per coordinate class.
+    objs_add = [[cls(a, w=1.0) for a in atoms] for cls in classes]
+    vals_add = [[[None] * len(atoms)] for cls in classes]
+    return objs_add, vals_add
+
+def _handle_atom_set(molecule, coords, s, key, classes, n_atom, atoms):
+    objs_add = [[cls(a, w=1.0) for a in atoms] for cls in classes]
+    x1 = [float(i) * ang2bohr for i in s[2:2+len(classes)]]
+    vals_add = [[[x1[icls]] * len(atoms)] for icls in range(len(classes))]
+    return objs_add, vals_add
+
+def _handle_atom_scan(molecule, coords, s, key, classes, n_atom, atoms):
+    # The x-coordinate of all the atoms in a group is a
+    # list of constraints that is scanned in 1-D.
+    objs_add = [[cls(a, w=1.0) for a in atoms] for cls in classes]
+    nc = len(classes)
+    x1 = np.array([float(i) for i in s[2:2+nc]]) * ang2bohr
+    x2 = np.array([float(i) for i in s[2+nc:2+2*nc]]) * ang2bohr
+    nstep = int(s[2+2*nc])
+    # C-contiguous (nstep, nc) scan grid, one column per coordinate class;
+    # each column is broadcast over the atom group and converted to lists
+    # only at the boundary.
+    valscan = np.linspace(x1, x2, nstep, axis=0)
+    vals_add = [np.repeat(valscan[:, icls:icls+1], len(atoms), axis=1).tolist() for icls in range(nc)]
+    return objs_add, vals_add
+
+def _trans_objs(classes, atoms):
+    # If there is more than one atom, then the center of mass is constrained,
+    # so we pick the classes that take a weighted group of atoms.
+    if len(atoms) > 1:
+        return [[cls(atoms, w=np.ones(len(atoms))/len(atoms)) for cls in classes]]
+    else:
+        return [[cls(atoms[0], w=1.0) for cls in classes]]
+
+def _handle_trans_freeze(molecule, coords, s, key, classes, n_atom, atoms):
+    # LPW 2016-02-10:
+    # trans-x, trans-y, trans-z is a GROUP of constraints
+    # Each group of constraints gets a [[None, None, None]] appended to vals
+    return _trans_objs(classes, atoms), [[[None] * len(classes)]]
+
+def _handle_trans_set(molecule, coords, s, key, classes, n_atom, atoms):
+    # Depending on how many coordinates are constrained, we read in the corresponding
+    # number of constraint values.
+    x1 = [float(i) * ang2bohr for i in s[2:2+len(classes)]]
+    return _trans_objs(classes, atoms), [[x1]]
+
+def _handle_trans_scan(molecule, coords, s, key, classes, n_atom, atoms):
+    # If we're scanning it, then we add the whole list of distances to the list-of-lists
+    nc = len(classes)
+    x1 = np.array([float(i) for i in s[2:2+nc]]) * ang2bohr
+    x2 = np.array([float(i) for i in s[2+nc:2+2*nc]]) * ang2bohr
+    nstep = int(s[2+2*nc])
+    return _trans_objs(classes, atoms), [np.linspace(x1, x2, nstep, axis=0).tolist()]
+
+def _dah_atoms(molecule, s, key, n_atom):
+    # Atom indices of a distance/angle/dihedral constraint, in canonical order.
+    atoms = [int(i)-1 for i in s[1:1+n_atom]]
+    if key == "distance" and atoms[0] > atoms[1]:
+        atoms = atoms[::-1]
+    if key == "angle" and atoms[0] > atoms[2]:
+        atoms = atoms[::-1]
+    if key == "dihedral" and atoms[1] > atoms[2]:
+        atoms = atoms[::-1]
+    if any([i<0 for i in atoms]):
+        raise RuntimeError("Atom numbers must start from 1")
+    if any([i>=molecule.na for i in atoms]):
+        raise RuntimeError("Constraints refer to higher atom indices than the number of atoms")
+    return atoms
+
+def _dah_val(s, key, pos):
+    # Distances are converted from Angstrom to Bohr, angles from degrees to radians.
+    if key == "distance":
+        return float(s[pos]) * ang2bohr
+    else:
+        return float(s[pos]) * np.pi / 180.0
+
+def _handle_dah_freeze(molecule, coords, s, key, classes, n_atom, atoms):
+    return [[classes[0](*_dah_atoms(molecule, s, key, n_atom))]], [[[None]]]
+
+def _handle_dah_set(molecule, coords, s, key, classes, n_atom, atoms):
+    objs_add = [[classes[0](*_dah_atoms(molecule, s, key, n_atom))]]
+    return objs_add, [[[_dah_val(s, key, 1+n_atom)]]]
+
+def _handle_dah_scan(molecule, coords, s, key, classes, n_atom, atoms):
+    objs_add = [[classes[0](*_dah_atoms(molecule, s, key, n_atom))]]
+    x1 = _dah_val(s, key, 1+n_atom)
+    x2 = _dah_val(s, key, 2+n_atom)
+    nstep = int(s[3+n_atom])
+    return objs_add, [[[i] for i in np.linspace(x1, x2, nstep).tolist()]]
+
+def _centroid_atoms(s):
+    atoms_a = uncommadash(s[1])
+    atoms_b = uncommadash(s[2])
+    if atoms_a[0] > atoms_b[0]:
+        atoms_a, atoms_b = atoms_b, atoms_a
+    return atoms_a, atoms_b
+
+def _handle_centroid_freeze(molecule, coords, s, key, classes, n_atom, atoms):
+    atoms_a, atoms_b = _centroid_atoms(s)
+    return [[classes[0](atoms_a, atoms_b)]], [[[None]]]
+
+def _handle_centroid_set(molecule, coords, s, key, classes, n_atom, atoms):
+    atoms_a, atoms_b = _centroid_atoms(s)
+    return [[classes[0](atoms_a, atoms_b)]], [[[float(s[3]) * ang2bohr]]]
+
+def _handle_centroid_scan(molecule, coords, s, key, classes, n_atom, atoms):
+    atoms_a, atoms_b = _centroid_atoms(s)
+    x1 = float(s[3]) * ang2bohr
+    x2 = float(s[4]) * ang2bohr
+    nstep = int(s[5])
+    return [[classes[0](atoms_a, atoms_b)]], [[[i] for i in np.linspace(x1, x2, nstep).tolist()]]
+
+def _rot_geometry(coords, spec):
+    # Selected atoms of a rotation group (users can only specify ranges of
+    # atoms) and their radius of gyration about the group centroid.
+    atoms = uncommadash(spec)
+    atoms_np = np.fromiter(atoms, dtype=np.intp, count=len(atoms))
+    sel = np.take(coords.reshape(-1, 3), atoms_np, axis=0)
+    sel -= sel.mean(axis=0)
+    # einsum fuses the square and sum into a single pass over sel
+    rg = np.sqrt(np.einsum('ij,ij->', sel, sel) / sel.shape[0])
+    return atoms, rg
+
+def _rot_axis_angle(s):
+    # Get the axis
+    u = np.array([float(s[i]) for i in range(2, 5)])
+    u /= np.linalg.norm(u)
+    # Get the angle
+    theta1 = float(s[5]) * np.pi / 180
+    # if np.abs(theta1) > np.pi * 0.9:
+    #     logger.info("Large rotation: Your constraint may not work\n")
+    return u, theta1
+
+def _handle_rotation_freeze(molecule, coords, s, key, classes, n_atom, atoms):
+    atoms, rg = _rot_geometry(coords, s[1])
+    objs_add = [[cls(atoms, coords, {}, w=rg)] for cls in classes]
+    vals_add = [[[None]] for cls in classes]
+    return objs_add, vals_add
+
+def _handle_rotation_set(molecule, coords, s, key, classes, n_atom, atoms):
+    atoms, rg = _rot_geometry(coords, s[1])
+    objs_add = [[cls(atoms, coords, {}, w=rg) for cls in classes]]
+    u, theta1 = _rot_axis_angle(s)
+    return objs_add, [[_rotset_vals(theta1, u, rg).tolist()]]
+
+def _handle_rotation_scan(molecule, coords, s, key, classes, n_atom, atoms):
+    atoms, rg = _rot_geometry(coords, s[1])
+    objs_add = [[cls(atoms, coords, {}, w=rg) for cls in classes]]
+    u, theta1 = _rot_axis_angle(s)
+    theta2 = float(s[6]) * np.pi / 180
+    steps = int(s[7])
+    # To alleviate future confusion:
+    # There is one group of three constraints that we are going to scan over in one dimension.
+    # Here we create one group of constraint values; each row is a triplet.
+    return objs_add, [_rotset_vals(np.linspace(theta1, theta2, steps), u, rg).tolist()]
+
+# Dispatch table mapping (key group, mode) to the handler for one line of the
+# constraints file, replacing a per-line cascade of string comparisons.
+_CONSTRAINT_DISPATCH = {('atom', 'freeze'): _handle_atom_freeze,
+                        ('atom', 'set'): _handle_atom_set,
+                        ('atom', 'scan'): _handle_atom_scan,
+                        ('trans', 'freeze'): _handle_trans_freeze,
+                        ('trans', 'set'): _handle_trans_set,
+                        ('trans', 'scan'): _handle_trans_scan,
+                        ('dah', 'freeze'): _handle_dah_freeze,
+                        ('dah', 'set'): _handle_dah_set,
+                        ('dah', 'scan'): _handle_dah_scan,
+                        ('centroid', 'freeze'): _handle_centroid_freeze,
+                        ('centroid', 'set'): _handle_centroid_set,
+                        ('centroid', 'scan'): _handle_centroid_scan,
+                        ('rot', 'freeze'): _handle_rotation_freeze,
+                        ('rot', 'set'): _handle_rotation_set,
+                        ('rot', 'scan'): _handle_rotation_scan,
+                        }
 
 
 def parse_constraints(molecule, constraints_string):
@@ -446,47 +746,28 @@ def parse_constraints(molecule, constraints_string):
     """
     mode = None
     Freezes = []
-    # The key in this dictionary is for looking up the following information:
-    # 1) The classes for creating the primitive coordinates corresponding to the constraint
-    # 2) The number of atomic indices that are required to specify the constraint
-    ClassDict = {"distance":([Distance], 2),
-                 "angle":([Angle], 3),
-                 "dihedral":([Dihedral], 4),
-                 "x":([CartesianX], 1),
-                 "y":([CartesianY], 1),
-                 "z":([CartesianZ], 1),
-                 "xy":([CartesianX, CartesianY], 1),
-                 "xz":([CartesianX, CartesianZ], 1),
-                 "yz":([CartesianY, CartesianZ], 1),
-                 "xyz":([CartesianX, CartesianY, CartesianZ], 1),
-                 "trans-x":([TranslationX], 1),
-                 "trans-y":([TranslationY], 1),
-                 "trans-z":([TranslationZ], 1),
-                 "trans-xy":([TranslationX, TranslationY], 1),
-                 "trans-xz":([TranslationX, TranslationZ], 1),
-                 "trans-yz":([TranslationY, TranslationZ], 1),
-                 "trans-xyz":([TranslationX, TranslationY, TranslationZ], 1),
-                 "rotation":([RotationA, RotationB, RotationC], 1),
-                 "centroid_distance":([CentroidDistance], 2)
-                 }
-    AtomKeys = ["x", "y", "z", "xy", "yz", "xz", "xyz"]
-    TransKeys = ["trans-x", "trans-y", "trans-z", "trans-xy", "trans-yz", "trans-xz", "trans-xyz"]
+    # Invariants hoisted out of the parse loop below.
+    elem_lower = frozenset(k.lower() for k in Elements)
+    # Lowercased element symbols of the molecule as a fixed-width string array,
+    # shared by all element-keyed constraint lines; the per-line selection is
+    # then a single vectorized compare inside NumPy instead of an O(N) Python
+    # loop over molecule.elem.
+    elem_arr = np.array([e.lower() for e in molecule.elem])
     objs = []
     vals = []
-    coords = molecule.xyzs[0].flatten() * ang2bohr
-    in_options = False
+    # ravel returns a view for contiguous coordinates, so the unit conversion
+    # is the only array allocated here.
+    coords = molecule.xyzs[0].ravel() * ang2bohr
+    # Pull any $options blocks out of the string in one pass and echo them to
+    # the log, so the per-line loop below only ever handles constraint data.
+    def log_options(match):
+        logger.info("-> Additional optimizer options provided in the constraints file:\n")
+        for optline in match.group(0).split('\n'):
+            if len(optline) > 0: logger.info("-> " + optline + "\n")
+        return ''
+    constraints_string = _OPTIONS_BLOCK_RE.sub(log_options, constraints_string)
     for line in constraints_string.split('\n'):
-        # Skip over the options block in the constraints file
-        if '$options' in line:
-            in_options = True
-            logger.info("-> Additional optimizer options provided in the constraints file:\n")
-        if in_options:
-            if '$end' in line:
-                in_options = False
-            if len(line) > 0: logger.info("-> " + line+"\n")
-            continue
-        # End skipping over the options block
-        line = line.split("#")[0].strip().lower()
+        line = line.partition("#")[0].strip().lower()
         if len(line) == 0: continue
         logger.info(line+'\n')
         # This is a list-of-lists. The intention is to create a multidimensional grid
@@ -498,11 +779,12 @@ def parse_constraints(molecule, constraints_string):
                 raise RuntimeError("Mode ($freeze, $set, $scan) must be set before specifying any constraints")
             s = line.split()
             key = s[0]
-            if ''.join(sorted(key)) in AtomKeys:
+            if ''.join(sorted(key)) in _ATOM_KEYS:
                 key = ''.join(sorted(key))
-            elif ''.join(sorted(key.replace('trans-',''))) in AtomKeys:
+            elif ''.join(sorted(key.replace('trans-',''))) in _ATOM_KEYS:
                 key = 'trans-'+''.join(sorted(key.replace('trans-','')))
-            classes, n_atom = ClassDict[key]
+            classes = _CLASSES_FOR_KEY[key]
+            n_atom = _NATOM_FOR_KEY[key]
             if mode == "freeze":
                 ntok = n_atom
             elif mode == "set":
@@ -517,159 +799,32 @@ def parse_constraints(molecule, constraints_string):
                     ntok = n_atom + 2*len(classes) + 1
             if len(s) != (ntok+1):
                 raise RuntimeError("For this line:%s\nExpected %i tokens but got %i" % (line, ntok+1, len(s)))
-            if key in AtomKeys or key in TransKeys:
+            atoms = None
+            if key in _ATOM_KEYS or key in _TRANS_KEYS:
                 # Special code that works for atom position and translation constraints.
+                kg = 'atom' if key in _ATOM_KEYS else 'trans'
                 if isint(s[1]):
                     atoms = [int(s[1])-1]
-                elif s[1] in [k.lower() for k in Elements]:
-                    atoms = [i for i in range(molecule.na) if molecule.elem[i].lower() == s[1]]
+                elif s[1] in elem_lower:
+                    atoms = np.flatnonzero(elem_arr == s[1]).tolist()
                 else:
                     atoms = uncommadash(s[1])
-                if any([i<0 for i in atoms]):
+                atoms_np = np.asarray(atoms)
+                if (atoms_np < 0).any():
                     raise RuntimeError("Atom numbers must start from 1")
-                if any([i>=molecule.na for i in atoms]):
+                if (atoms_np >= molecule.na).any():
                     raise RuntimeError("Constraints refer to higher atom indices than the number of atoms")
-            if key in AtomKeys:
-                # The x-coordinate of all the atoms in a group is a
-                # list of constraints that is scanned in 1-D.
-                for cls in classes:
-                    objs.append([cls(a, w=1.0) for a in atoms])
-                if mode == "freeze":
-                    for cls in classes:
-                        vals.append([[None for a in atoms]])
-                elif mode == "set":
-                    x1 = [float(i) * ang2bohr for i in s[2:2+len(classes)]]
-                    for icls, cls in enumerate(classes):
-                        vals.append([[x1[icls] for a in atoms]])
-                elif mode == "scan":
-                    # If we're scanning it, then we add the whole list of distances to the list-of-lists
-                    x1 = [float(i) * ang2bohr for i in s[2:2+len(classes)]]
-                    x2 = [float(i) * ang2bohr for i in s[2+len(classes):2+2*len(classes)]]
-                    nstep = int(s[2+2*len(classes)])
-                    valscan = one_dimensional_scan(x1, x2, nstep)
-                    for icls, cls in enumerate(classes):
-                        vals.append([[v[icls] for a in atoms] for v in valscan])
-            elif key in TransKeys:
-                # If there is more than one atom and the mode is "set" or "scan", then the
-                # center of mass is constrained, so we pick the corresponding classes.
-                if len(atoms) > 1:
-                    objs.append([cls(atoms, w=np.ones(len(atoms))/len(atoms)) for cls in classes])
-                else:
-                    objs.append([cls(atoms[0], w=1.0) for cls in classes])
-                if mode == "freeze":
-                    # LPW 2016-02-10:
-                    # trans-x, trans-y, trans-z is a GROUP of constraints
-                    # Each group of constraints gets a [[None, None, None]] appended to vals
-                    vals.append([[None for cls in classes]])
-                elif mode == "set":
-                    # Depending on how many coordinates are constrained, we read in the corresponding
-                    # number of constraint values.
-                    x1 = [float(i) * ang2bohr for i in s[2:2+len(classes)]]
-                    # If there's just one constraint value then we append it to the value list-of-lists
-                    vals.append([x1])
-                elif mode == "scan":
-                    # If we're scanning it, then we add the whole list of distances to the list-of-lists
-                    x1 = [float(i) * ang2bohr for i in s[2:2+len(classes)]]
-                    x2 = [float(i) * ang2bohr for i in s[2+len(classes):2+2*len(classes)]]
-                    nstep = int(s[2+2*len(classes)])
-                    vals.append(one_dimensional_scan(x1, x2, nstep))
-            elif key in ["distance", "angle", "dihedral"]:
+            elif key == 'rotation':
+                kg = 'rot'
+            elif key == 'centroid_distance':
+                kg = 'centroid'
+            else:
+                kg = 'dah'
                 if len(classes) != 1:
                     raise RuntimeError("Not OK!")
-                atoms = [int(i)-1 for i in s[1:1+n_atom]]
-                if key == "distance" and atoms[0] > atoms[1]:
-                    atoms = atoms[::-1]
-                if key == "angle" and atoms[0] > atoms[2]:
-                    atoms = atoms[::-1]
-                if key == "dihedral" and atoms[1] > atoms[2]:
-                    atoms = atoms[::-1]
-                if any([i<0 for i in atoms]):
-                    raise RuntimeError("Atom numbers must start from 1")
-                if any([i>=molecule.na for i in atoms]):
-                    raise RuntimeError("Constraints refer to higher atom indices than the number of atoms")
-                objs.append([classes[0](*atoms)])
-                if mode == "freeze":
-                    vals.append([[None]])
-                elif mode in ["set", "scan"]:
-                    if key == "distance": x1 = float(s[1+n_atom]) * ang2bohr
-                    else: x1 = float(s[1+n_atom])*np.pi/180.0
-                    if mode == "set":
-                        vals.append([[x1]])
-                    else:
-                        if key == "distance": x2 = float(s[2+n_atom]) * ang2bohr
-                        else: x2 = float(s[2+n_atom])*np.pi/180.0
-                        nstep = int(s[3+n_atom])
-                        vals.append([[i] for i in list(np.linspace(x1,x2,nstep))])
-            elif key in ["centroid_distance"]:
-                atoms_a = uncommadash(s[1])
-                atoms_b = uncommadash(s[2])
-                if atoms_a[0] > atoms_b[0]:
-                    atoms_c = atoms_a[:]
-                    atoms_a = atoms_b[:]
-                    atoms_b = atoms_c[:]
-                objs.append([classes[0](atoms_a, atoms_b)])
-                if mode == "freeze":
-                    vals.append([[None]])
-                elif mode in ["set", "scan"]:
-                    x1 = float(s[3]) * ang2bohr
-                    if mode == "set":
-                        vals.append([[x1]])
-                    else:
-                        x2 = float(s[4]) * ang2bohr
-                        nstep = int(s[5])
-                        vals.append([[i] for i in list(np.linspace(x1,x2,nstep))])
-            elif key in ["rotation"]:
-                # User can only specify ranges of atoms
-                atoms = uncommadash(s[1])
-                sel = coords.reshape(-1,3)[atoms,:]  * ang2bohr
-                sel -= np.mean(sel, axis=0)
-                rg = np.sqrt(np.mean(np.sum(sel**2, axis=1)))
-                if mode == "freeze":
-                    for cls in classes:
-                        objs.append([cls(atoms, coords, {}, w=rg)])
-                        vals.append([[None]])
-                elif mode in ["set", "scan"]:
-                    objs.append([cls(atoms, coords, {}, w=rg) for cls in classes])
-                    # Get the axis
-                    u = np.array([float(s[i]) for i in range(2, 5)])
-                    u /= np.linalg.norm(u)
-                    # Get the angle
-                    theta1 = float(s[5]) * np.pi / 180
-                    # if np.abs(theta1) > np.pi * 0.9:
-                    #     logger.info("Large rotation: Your constraint may not work\n")
-                    if mode == "set":
-                        # Get the periodic image that is inside of the pi-sphere.
-                        theta3 = (theta1 + np.pi) % (2*np.pi) - np.pi
-                        c = np.cos(theta3/2.0)
-                        s = np.sin(theta3/2.0)
-                        q = np.array([c, u[0]*s, u[1]*s, u[2]*s])
-                        fac, _ = calc_fac_dfac(c)
-                        v1 = fac*q[1]*rg
-                        v2 = fac*q[2]*rg
-                        v3 = fac*q[3]*rg
-                        vals.append([[v1, v2, v3]])
-                    elif mode == "scan":
-                        theta2 = float(s[6]) * np.pi / 180
-                        # if np.abs(theta2) > np.pi * 0.9:
-                        #     logger.info("Large rotation: Your constraint may not work\n")
-                        steps = int(s[7])
-                        # To alleviate future confusion:
-                        # There is one group of three constraints that we are going to scan over in one dimension.
-                        # Here we create one group of constraint values.
-                        # We will add triplets of constraint values to this group
-                        vs = []
-                        for theta in np.linspace(theta1, theta2, steps):
-                            # Get the periodic image that is inside of the pi-sphere.
-                            theta3 = (theta + np.pi) % (2*np.pi) - np.pi
-                            c = np.cos(theta3/2.0)
-                            s = np.sin(theta3/2.0)
-                            q = np.array([c, u[0]*s, u[1]*s, u[2]*s])
-                            fac, _ = calc_fac_dfac(c)
-                            v1 = fac*q[1]*rg
-                            v2 = fac*q[2]*rg
-                            v3 = fac*q[3]*rg
-                            vs.append([v1, v2, v3])
-                        vals.append(vs)
+            objs_add, vals_add = _CONSTRAINT_DISPATCH[(kg, mode)](molecule, coords, s, key, classes, n_atom, atoms)
+            objs.extend(objs_add)
+            vals.extend(vals_add)
     if len(objs) != len(vals):
         raise RuntimeError("objs and vals should be the same length")
     valgrps = [list(itertools.chain(*i)) for i in list(itertools.product(*vals))]
@@ -54,6 +54,11 @@ import numpy as np
 from geometric.molecule import *
 from geometric.nifty import invert_svd, logger
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 """
 """
 
@@ -675,8 +680,29 @@ def get_rot_der(x, y, second=False, fdcheck=False, r=np.array([0.0, 0.0, 0.0, 0.
 def calc_fac_dfac(q0, second=False):
     """
     Calculate the prefactor mapping the quaternion to the exponential map
-    and also its derivative. Takes the first element of the quaternion only
-    """
+    and also its derivative. Takes the first element of the quaternion only,
+    which may be either a scalar or a 1D array (evaluated elementwise).
+    """
+    if isinstance(q0, np.ndarray):
+        qm1 = q0 - 1.0
+        fac = np.empty_like(q0)
+        dfac = np.empty_like(q0)
+        # Ill-defined around q0=1.0; use the Taylor expansion there
+        taylor = np.abs(qm1) < 1e-8
+        direct = ~taylor
+        fac[taylor] = 2 - 2*qm1[taylor]/3
+        dfac[taylor] = -2.0/3.0
+        q = q0[direct]
+        s = np.sqrt(1-q**2)
+        a = np.arccos(q)
+        fac[direct] = 2*a/s
+        dfac[direct] = -2/s**2 + 2*q*a/s**3
+        if second:
+            dfac2 = np.empty_like(q0)
+            dfac2[taylor] = 0.0
+            dfac2[direct] = (2/s**4) * (-3*q + (1+2*q**2)*a/s)
+            return fac, dfac, dfac2
+        return fac, dfac
     # Ill-defined around q0=1.0
     qm1 = q0-1.0
     # if np.abs(q0) == 1.0:
@@ -700,6 +726,36 @@ def calc_fac_dfac(q0, second=False):
     else:
         return fac, dfac
 
+def _fac_dfac_vec_kernel(q0, fac, dfac):
+    for i in range(q0.shape[0]):
+        qm1 = q0[i] - 1.0
+        if abs(qm1) < 1e-8:
+            fac[i] = 2 - 2*qm1/3
+            dfac[i] = -2.0/3.0
+        else:
+            s = np.sqrt(1-q0[i]**2)
+            a = np.arccos(q0[i])
+            fac[i] = 2*a/s
+            dfac[i] = -2/s**2 + 2*q0[i]*a/s**3
+
+if njit is not None:
+    _fac_dfac_vec_kernel = njit(cache=True, fastmath=True)(_fac_dfac_vec_kernel)
+
+def calc_fac_dfac_vec(q0):
+    """
+    Vectorized version of calc_fac_dfac for a 1D array of quaternion first
+    elements; returns the (fac, dfac) arrays.  When Numba is installed the
+    elementwise loop is JIT-compiled, so a single call amortizes the dispatch
+    overhead over the whole array; otherwise the NumPy array path is used.
+    """
+    q0 = np.ascontiguousarray(q0, dtype=float)
+    if njit is None:
+        return calc_fac_dfac(q0)
+    fac = np.empty_like(q0)
+    dfac = np.empty_like(q0)
+    _fac_dfac_vec_kernel(q0, fac, dfac)
+    return fac, dfac
+
 def get_expmap(x, y, r=np.array([0.0, 0.0, 0.0, 0.0])):
     """
     Calculate the exponential map that rotates x into maximal coincidence with y
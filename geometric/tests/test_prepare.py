@@ -67,8 +67,8 @@ $end"""
     assert len(ics) == 9
     assert ics[0].a == (0,1,2,3,4,5)
     assert vals[0][:3] == [None, None, None]
-    rg2 = 5.978207642
-    rg3 = 7.668148025
+    rg2 = 3.163531247
+    rg3 = 4.057809185
     np.testing.assert_almost_equal(vals[0][3:6], [rg2*np.pi/6, 0.0, 0.0])
     np.testing.assert_almost_equal(vals[2][3:6], [rg2*np.pi/6, 0.0, 0.0])
     np.testing.assert_almost_equal(vals[0][6:9], [0.0, 0.0, 0.0])
@@ -28,6 +28,20 @@ def test_q_der():
     assert np.allclose(a2, l2, atol=1.e-7)
     assert np.allclose(q, q_ref, atol=1.e-7)
     
+def test_calc_fac_dfac_array():
+    # The array code path should agree elementwise with the scalar one,
+    # including near the ill-defined point q0=1.0.
+    q0 = np.array([-0.99, -0.5, 0.0, 0.5, 0.99, 1.0 - 1e-9, 1.0])
+    fac, dfac, dfac2 = geometric.rotate.calc_fac_dfac(q0, second=True)
+    for i in range(len(q0)):
+        fac_i, dfac_i, dfac2_i = geometric.rotate.calc_fac_dfac(q0[i].item(), second=True)
+        assert np.allclose(fac[i], fac_i, atol=1.e-12)
+        assert np.allclose(dfac[i], dfac_i, atol=1.e-12)
+        assert np.allclose(dfac2[i], dfac2_i, atol=1.e-12)
+    fac_v, dfac_v = geometric.rotate.calc_fac_dfac_vec(q0)
+    assert np.allclose(fac_v, fac, atol=1.e-12)
+    assert np.allclose(dfac_v, dfac, atol=1.e-12)
+
 def test_expmap_der():
     M = geometric.molecule.Molecule(os.path.join(datad, 'water5.xyz'))
     x = M.xyzs[0]